@@ -1,4 +1,4 @@
-#!/usr/bin/python
+#!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
 """This script uses sinoparserd to generate transcriptions for several sentences
@@ -6,35 +6,58 @@ read from standard input and outputs them in the same format as Tatoeba's
 exported transcription files, in order to make it easy to compare them.
 """
 
-from __future__ import print_function
-
+import itertools
+from multiprocessing.pool import ThreadPool
 import re
+import socket
+import threading
+from http.client import HTTPConnection, HTTPException
+from urllib.parse import quote
 import xml.etree.ElementTree as ET
 
-try:
-    from urllib.request import quote, urlopen
-except ImportError:  # Python 2
-    from urllib2 import quote, urlopen
 
+# Every worker thread keeps its own connection to sinoparserd open, so that we
+# don't pay for a new TCP handshake for every sentence.
+_local = threading.local()
+_connections = []
 
-def utf8(text):
-    if type(text) != str:
-        return text.encode('utf-8')
-    return text
+
+SPACE_BEFORE_PUNCTUATION = re.compile(r'\s+([!?:;.,])')
+QUOTED = re.compile(r'"\s*([^"]+)\s*"')
 
 
 def basic_pinyin_cleanup(text):
     # See tatoeba2/src/Lib/Autotranscription.php: _basic_pinyin_cleanup
-    text = re.sub(r'\s+([!?:;.,])', r'\1', text)
-    text = re.sub(r'"\s*([^"]+)\s*"', r'"\1"', text)
+    text = SPACE_BEFORE_PUNCTUATION.sub(r'\1', text)
+    text = QUOTED.sub(r'"\1"', text)
     text = text[0].upper() + text[1:]
     return text
 
 
+def get_connection():
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        connection = _local.connection = HTTPConnection('localhost', 8080)
+        _connections.append(connection)
+    return connection
+
+
+def get(path):
+    connection = get_connection()
+    try:
+        connection.request('GET', path)
+        return connection.getresponse().read()
+    except (HTTPException, socket.error):
+        # The server may have closed the idle connection, so try once more
+        # with a fresh one.
+        connection.close()
+        connection.request('GET', path)
+        return connection.getresponse().read()
+
+
 def transcribe(text):
-    response = urlopen('http://localhost:8080/all?str='+quote(text))
-    xml = ET.fromstring(response.read())
-    data = {child.tag: utf8(child.text) for child in xml}
+    xml = ET.fromstring(get('/all?str='+quote(text)))
+    data = {child.tag: child.text for child in xml}
     script = {
         'simplified_script': 'Hans',
         'traditional_script': 'Hant'
@@ -49,14 +72,33 @@ def transcribe(text):
     return transcriptions
 
 
+def transcribe_line(line):
+    n, lang, text = line.rstrip('\n').split('\t', 2)
+    return n, lang, transcribe(text)
+
+
 def main(argv):
-    from sys import stdin
+    from sys import stdin, stdout
+    stdin.reconfigure(encoding='utf-8')
+    stdout.reconfigure(encoding='utf-8')
     user = '' # automatic transcriptions are marked by an empty username
-    for line in stdin.readlines():
-        n, lang, text = line.rstrip('\n').split('\t', 2)
-        transcriptions = transcribe(text)
-        for script, transcription in sorted(transcriptions.items()):
-            print(n, lang, script, user, transcription, sep='\t')
+    # The requests are network-bound, so we keep several of them in flight at
+    # once. imap() yields the results in input order, but it reads all of its
+    # input into the task queue right away, so we hand it stdin in batches.
+    pool = ThreadPool(32)
+    try:
+        while True:
+            lines = list(itertools.islice(stdin, 1024))
+            if not lines:
+                break
+            for n, lang, transcriptions in pool.imap(transcribe_line, lines):
+                for script, transcription in sorted(transcriptions.items()):
+                    print(n, lang, script, user, transcription, sep='\t')
+    finally:
+        pool.close()
+        pool.join()
+        for connection in _connections:
+            connection.close()
 
 
 if __name__ == '__main__':
@@ -1,22 +1,16 @@
-#!/usr/bin/python
+#!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
 """This is a script for comparing different possible transcriptions of the same
 sentences and for tallying up which differences are the most common.
 """
 
-from __future__ import division, print_function
-
 import collections
-import difflib
+import io
 import itertools
-
-
-def print_utf8(text):
-    if type(text) != str:
-        print(text.encode('utf-8'))
-    else:
-        print(text)
+import multiprocessing
+import os
+import sys
 
 
 def read_transcriptions(filename):
@@ -25,15 +19,16 @@ def read_transcriptions(filename):
     Sentence ID, language code, script code, user name and transcription, each
     separated by tabs.
     """
-    with open(filename, 'rb') as f:
-        transcriptions = {
-            (id, lang, script): (user, transcription)
-            for id, lang, script, user, transcription
-            in (
-                line.decode('utf-8').rstrip('\n').split('\t')
-                for line in f.readlines()
+    transcriptions = {}
+    # Lines end only at '\n'; a stray '\r' belongs to the transcription.
+    with open(
+        filename, encoding='utf-8', newline='\n', buffering=1 << 20
+    ) as f:
+        for line in f:
+            id, lang, script, user, transcription = (
+                line.rstrip('\n').split('\t', 4)
             )
-        }
+            transcriptions[id, lang, script] = (user, transcription)
     some_reviewed = any(user for user, transcription in transcriptions.values())
     if some_reviewed:
         # If there are reviewed transcriptions, the automatically generated ones
@@ -50,54 +45,155 @@ def read_transcriptions(filename):
         }
 
 
+def longest_common_substring(strings):
+    """Given a sequence of strings, find a longest substring they all have in
+    common. Return the index of its first occurrence in each string together
+    with its length.
+
+    This builds a suffix automaton for one of the strings and runs all others
+    through it, which takes time linear in the total length of the strings.
+    """
+    # Building the automaton for the shortest string keeps it small; choosing
+    # it independently of the order of the input keeps the result
+    # deterministic when there are several equally long common substrings.
+    first = min(strings, key=lambda string: (len(string), string))
+
+    # Each state of the automaton represents a set of substrings of `first` that
+    # end at the same positions. `length` is the length of the longest of them,
+    # `link` points to the state of its longest suffix in another state and `end`
+    # is its first end position.
+    length = [0]
+    link = [-1]
+    transitions = [{}]
+    end = [-1]
+    last = 0
+    for position, char in enumerate(first):
+        current = len(length)
+        length.append(length[last] + 1)
+        link.append(0)
+        transitions.append({})
+        end.append(position)
+        state = last
+        while state != -1 and char not in transitions[state]:
+            transitions[state][char] = current
+            state = link[state]
+        if state != -1:
+            next_state = transitions[state][char]
+            if length[state] + 1 == length[next_state]:
+                link[current] = next_state
+            else:
+                clone = len(length)
+                length.append(length[state] + 1)
+                link.append(link[next_state])
+                transitions.append(dict(transitions[next_state]))
+                end.append(end[next_state])
+                while state != -1 and transitions[state].get(char) == next_state:
+                    transitions[state][char] = clone
+                    state = link[state]
+                link[next_state] = clone
+                link[current] = clone
+        last = current
+
+    # Longer states first, so that matches can be propagated along suffix links.
+    order = sorted(range(len(length)), key=length.__getitem__, reverse=True)
+    # For each state, the length of the longest of its substrings that occurs in
+    # all strings.
+    common = list(length)
+    # Transcriptions often agree, so many strings are equal. Each distinct one
+    # only needs to be run through the automaton once, and `first` not at all.
+    for other in set(strings) - {first}:
+        matched = [0] * len(length)
+        state = 0
+        size = 0
+        for char in other:
+            while state and char not in transitions[state]:
+                state = link[state]
+                size = length[state]
+            if char in transitions[state]:
+                state = transitions[state][char]
+                size += 1
+            else:
+                size = 0
+            if size > matched[state]:
+                matched[state] = size
+        for state in order:
+            parent = link[state]
+            if matched[state] and parent != -1:
+                matched[parent] = max(
+                    matched[parent], min(matched[state], length[parent])
+                )
+        common = list(map(min, common, matched))
+
+    size = max(common)
+    start = min(
+        end[state] + 1 - size
+        for state in range(len(common))
+        if common[state] == size
+    )
+    substring = first[start:start+size]
+    return tuple(string.find(substring) for string in strings), size
+
+
+def common_blocks(*args):
+    """Given an arbitrary number of strings, find blocks of substrings that occur
+    in all of them in the same order.
+
+    Like difflib's Ratcliff-Obershelp algorithm, this picks a longest common
+    substring and recurses on the parts to the left and to the right of it.
+    The result is a sorted list of pairs (starts, n), where
+    args[k][starts[k]:starts[k]+n] is the same for every k.
+    """
+    blocks = []
+    queue = [((0,) * len(args), tuple(map(len, args)))]
+    while queue:
+        lows, highs = queue.pop()
+        parts = [arg[low:high] for arg, low, high in zip(args, lows, highs)]
+        # Transcriptions mostly agree, so most of the input is usually covered
+        # by the prefix and suffix shared by all strings. Like diff-match-patch,
+        # we strip those first, which is much cheaper than the general search.
+        n = len(os.path.commonprefix(parts))
+        if n:
+            blocks.append((lows, n))
+            lows = tuple(low + n for low in lows)
+            parts = [part[n:] for part in parts]
+        n = len(os.path.commonprefix([part[::-1] for part in parts]))
+        if n:
+            highs = tuple(high - n for high in highs)
+            blocks.append((highs, n))
+            parts = [part[:len(part)-n] for part in parts]
+        starts, n = longest_common_substring(parts)
+        if n:
+            starts = tuple(low + start for low, start in zip(lows, starts))
+            blocks.append((starts, n))
+            queue.append((lows, starts))
+            queue.append((tuple(start + n for start in starts), highs))
+    blocks.sort()
+    return blocks
+
+
 def shared_substring(*args):
     """Given an arbitrary number of strings, determine a long substring they all
     have in common.
     """
     # There can be multiple equally valid solutions,
     # e.g. shared_substring('ab', 'ba') could be either 'a' or 'b'.
-    # To reduce the nondeterminism a bit, we sort the input, so the output does
-    # not depend on the particular order of the input strings.
-    args = sorted(args)
-    shared = args[0]
-    while True:
-        pre_shared = shared
-        for arg in args:
-            shared = ''.join(
-                shared[i:i+n]
-                for i, j, n
-                in difflib.SequenceMatcher(None, shared, arg).get_matching_blocks()
-            )
-        # In theory, `shared` should now be a subsequence of all arguments.
-        # In practice, Python's SequenceMatcher applies some heuristics against
-        # spurious matches, so we iterate until those are eliminated.
-        if shared == pre_shared:
-            return shared
+    # common_blocks picks one that does not depend on the particular order of
+    # the input strings.
+    return ''.join(
+        args[0][starts[0]:starts[0]+n] for starts, n in common_blocks(*args)
+    )
 
 
 def align(*args):
     """Split an arbitrary number of strings into a sequence of substrings that
     correspond to each other, thus highlighting differences between the strings.
     """
-    shared = shared_substring(*args)
+    blocks = common_blocks(*args)
+    # The common blocks are the same in all strings, so we only need the
+    # position of each block within each string.
     matches = [
-        difflib.SequenceMatcher(None, shared, arg).get_matching_blocks()
-        for arg in args
-    ]
-    # Some matching blocks may be merged in some strings and not others, so we
-    # determine all indices that start a match in any of the strings.
-    starts = sorted(set(i for m in matches for i, j, n in m))
-    # The corresponding block ends at the next start or the end of the string.
-    ends = starts[1:]+[len(shared)]
-    # Then we can split larger blocks into smaller ones.
-    matches = [
-        [
-            (j + start - i, end - start)
-            for i, j, n in m
-            for start, end in zip(starts, ends)
-            if start in range(i, i+n)
-        ]
-        for m in matches
+        [(starts[k], n) for starts, n in blocks]
+        for k in range(len(args))
     ]
 
     # The matching blocks also determine the position of the mismatches:
@@ -122,19 +218,49 @@ def align(*args):
     return blocks
 
 
+def block_offsets(aligned):
+    """Given an alignment as returned by `align`, return the aligned strings
+    and, for every block, the offsets at which it starts in each of them.
+    The offsets after the last block are the lengths of the strings."""
+    strings = tuple(''.join(column) for column in zip(*aligned))
+    offsets = [(0,) * len(strings)]
+    for block in aligned:
+        offsets.append(
+            tuple(offset + len(b) for offset, b in zip(offsets[-1], block))
+        )
+    return strings, offsets
+
+
+def align_transcriptions(item):
+    """Align the transcriptions of a single sentence, ignoring whitespace.
+
+    This takes and returns the sentence key along with the alignment, so that it
+    can be mapped over all sentences by a `multiprocessing.Pool`.
+    """
+    key, transcriptions = item
+    normalized = [
+        ''.join(transcription.split()) for transcription in transcriptions
+    ]
+    return key, align(*normalized)
+
+
 class DiffWithContext(object):
     """A block that is part of an alignment of multiple strings, together with
     the context to the left and right."""
 
-    def __init__(self, sentence_id, aligned, index):
+    def __init__(self, sentence_id, aligned, index, shared=None):
+        # The result of block_offsets(aligned) can be passed in as `shared` to
+        # share it between all blocks of the same alignment.
+        if shared is None:
+            shared = block_offsets(aligned)
+        strings, offsets = shared
         self.sentence_id = sentence_id
         self.block = aligned[index]
-        # self.block is included in the zip below only to get the correct length
         self.left_context = [
-            ''.join(string[1:]) for string in zip(self.block, *aligned[:index])
+            string[:offset] for string, offset in zip(strings, offsets[index])
         ]
         self.right_context = [
-            ''.join(string[1:]) for string in zip(self.block, *aligned[index+1:])
+            string[offset:] for string, offset in zip(strings, offsets[index+1])
         ]
 
     def left_len(self):
@@ -184,15 +310,20 @@ def shared_context_size(blocks):
             return (left_len, right_len)
 
 
-def largest_subgroup(blocks):
+def largest_subgroup(blocks, shared_context=None):
     """Given a collection of `DiffWithContext` objects, determine the largest
-    subgroup whose shared context is not the same as that of all others."""
+    subgroup whose shared context is not the same as that of all others.
+
+    If the caller already knows `shared_context_size(blocks)`, it can pass it
+    as `shared_context` to avoid computing it again."""
 
     blocks = list(blocks)
     if len(blocks) == 1:
         return blocks
 
-    left_len, right_len = shared_context_size(blocks)
+    if shared_context is None:
+        shared_context = shared_context_size(blocks)
+    left_len, right_len = shared_context
     candidates = []
     go_left = collections.Counter(
         b.with_context(left_len + 1, right_len) for b in blocks
@@ -217,17 +348,27 @@ def largest_subgroup(blocks):
     ]
 
 
-def split_into_subgroups(blocks):
+def split_into_subgroups(blocks, shared_context=None):
     """Given a collection of `DiffWithContext` objects, split it into smaller
-    groups that each share a particular context."""
+    groups that each share a particular context.
+
+    As for `largest_subgroup`, `shared_context` can be passed in if it is
+    already known."""
 
     blocks = list(blocks)
     groups = []
-    shared_context = shared_context_size(blocks)
-    while blocks and shared_context_size(blocks) == shared_context:
-        group = largest_subgroup(blocks)
-        blocks = [b for b in blocks if b not in group]
+    if shared_context is None:
+        shared_context = shared_context_size(blocks)
+    context = shared_context
+    while blocks and context == shared_context:
+        group = largest_subgroup(blocks, context)
+        # DiffWithContext compares by identity, so a set of ids does the same
+        # as `b not in group`, without scanning the group for every block.
+        group_ids = set(map(id, group))
+        blocks = [b for b in blocks if id(b) not in group_ids]
         groups.append(group)
+        if blocks:
+            context = shared_context_size(blocks)
 
     if blocks:
         groups.append(blocks)
@@ -235,44 +376,49 @@ def split_into_subgroups(blocks):
     return groups
 
 
-def show_hierarchically(blocks):
+def show_hierarchically(blocks, write=None):
     """Given a collection of `DiffWithContext` objects, print a representation
-    that makes the hierarchy of shared contexts visible."""
+    that makes the hierarchy of shared contexts visible.
+
+    The output goes to the `write` function, by default `sys.stdout.write`."""
+    if write is None:
+        write = sys.stdout.write
     if len(blocks) == 1:
         b = blocks[0]
-        print_utf8(
-            '<a href="https://tatoeba.org/eng/sentences/show/{}">#{}</a><br>'.format(
+        write(
+            '<a href="https://tatoeba.org/eng/sentences/show/{}">#{}</a><br>\n'.format(
                 b.sentence_id, b.sentence_id
             )
         )
-        print_utf8('<br>\n'.join(
+        write('<br>\n'.join(
             b.with_context(
                 b.left_len(),
                 b.right_len(),
                 left_sep='<b>',
                 right_sep='</b>'
             )
-        ))
+        ) + '\n')
     else:
+        shared_context_sizes = shared_context_size(blocks)
         shared_context = blocks[0].with_context(
-            *shared_context_size(blocks),
+            *shared_context_sizes,
             left_sep='<b>',
             right_sep='</b>'
         )
-        print_utf8('<details>')
-        print_utf8(
-            u'<summary>{} ({})</summary>'.format(
+        write('<details>\n')
+        write(
+            '<summary>{} ({})</summary>\n'.format(
                 ', '.join(shared_context),
                len(blocks)
             )
         )
-        print_utf8('<ul>')
-        for group in split_into_subgroups(blocks):
-            print_utf8('<li>')
-            show_hierarchically(group)
-            print_utf8('</li>')
-        print_utf8('</ul>')
-        print_utf8('</details>')
+        write('<ul>\n')
+        for group in split_into_subgroups(blocks, shared_context_sizes):
+            write('<li>\n')
+            show_hierarchically(group, write)
+            write('</li>\n')
+        write('</ul>\n')
+        write('</details>\n')
 
 
 def diff_pattern(block):
@@ -281,10 +427,11 @@ def diff_pattern(block):
 
 
 def main(argv):
+    sys.stdout.reconfigure(encoding='utf-8')
     filenames = argv[1:]
     transcriptions = [read_transcriptions(filename) for filename in filenames]
 
-    print_utf8(
+    print(
         '<h1>Differences between transcriptions in {}</h1>'.format(
             ', '.join('<i>'+filename+'</i>' for filename in filenames)
         )
@@ -294,37 +441,58 @@ def main(argv):
         set(trans.keys()) for trans in transcriptions
     ))
     diffs_with_context = collections.defaultdict(list)
-    for key in sorted(shared_keys):
-        normalized = [''.join(trans[key].split()) for trans in transcriptions]
-        aligned = align(*normalized)
-        for i, block in enumerate(aligned):
-            if len(set(block)) != 1:
-                diffs_with_context[block].append(
-                    DiffWithContext(key[0], aligned, i)
-                )
+    # Aligning is independent for every sentence, so it runs on all cores.
+    # imap() keeps the order of the sentences, which keeps the output stable.
+    pool = multiprocessing.Pool()
+    try:
+        alignments = pool.imap(
+            align_transcriptions,
+            (
+                (key, [trans[key] for trans in transcriptions])
+                for key in sorted(shared_keys)
+            ),
+            chunksize=64
+        )
+        for key, aligned in alignments:
+            shared = block_offsets(aligned)
+            for i, block in enumerate(aligned):
+                if len(set(block)) != 1:
+                    diffs_with_context[block].append(
+                        DiffWithContext(key[0], aligned, i, shared)
+                    )
+    finally:
+        pool.close()
+        pool.join()
 
 
     total = sum(map(len, diffs_with_context.values()))
+    pattern_of_block = {block: diff_pattern(block) for block in diffs_with_context}
     diff_pattern_counts = collections.Counter()
     for block, diffs in diffs_with_context.items():
-        diff_pattern_counts[diff_pattern(block)] += len(diffs)
+        diff_pattern_counts[pattern_of_block[block]] += len(diffs)
+    # Group the diffs by pattern once, most frequent blocks first.
+    diffs_by_pattern = collections.defaultdict(list)
+    for block, diffs in sorted(diffs_with_context.items(), key=lambda x: -len(x[1])):
+        diffs_by_pattern[pattern_of_block[block]].append(diffs)
     for pattern, count in diff_pattern_counts.most_common(len(diff_pattern_counts)):
-        print_utf8('<details>')
-        print_utf8(
-            '<summary>Pattern <em>{}</em>: {} times ({:.1f}%)</summary>'.format(
+        # Each section is collected in memory and written out at once.
+        section = io.StringIO()
+        write = section.write
+        write('<details>\n')
+        write(
+            '<summary>Pattern <em>{}</em>: {} times ({:.1f}%)</summary>\n'.format(
                 pattern, count, 100 * count/total
             )
         )
-        print_utf8('<ul>')
-        for block, diffs in sorted(diffs_with_context.items(), key=lambda x: -len(x[1])):
-            if diff_pattern(block) == pattern:
-                print_utf8('<li>')
-                show_hierarchically(diffs)
-                print_utf8('</li>')
-        print_utf8('</ul>')
-        print_utf8('</details>')
+        write('<ul>\n')
+        for diffs in diffs_by_pattern[pattern]:
+            write('<li>\n')
+            show_hierarchically(diffs, write)
+            write('</li>\n')
+        write('</ul>\n')
+        write('</details>\n')
+        sys.stdout.write(section.getvalue())
 
 
 if __name__ == '__main__':
-    import sys
     main(sys.argv)
@@ -1,9 +1,143 @@
-#!/usr/bin/python
+#!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
+import os
+import tempfile
 import unittest
 
-from __init__ import shared_substring, align, DiffWithContext
+from __init__ import (
+    read_transcriptions, longest_common_substring, common_blocks,
+    shared_substring, align, block_offsets, DiffWithContext
+)
+
+
+class TestReadTranscriptions(unittest.TestCase):
+    def read(self, content):
+        with tempfile.NamedTemporaryFile('wb', delete=False) as f:
+            f.write(content.encode('utf-8'))
+        try:
+            return read_transcriptions(f.name)
+        finally:
+            os.remove(f.name)
+
+    def test_carriage_return(self):
+        self.assertEqual(
+            {
+                ('1', 'cmn', 'Latn'): 'ni3 hao3\r ma5',
+                ('2', 'cmn', 'Latn'): 'zai4jian4',
+            },
+            self.read(
+                '1\tcmn\tLatn\t\tni3 hao3\r ma5\n'
+                '2\tcmn\tLatn\t\tzai4jian4\n'
+            )
+        )
+
+    def test_reviewed(self):
+        self.assertEqual(
+            {('2', 'cmn', 'Latn'): 'zai4 jian4'},
+            self.read(
+                '1\tcmn\tLatn\t\tni3hao3\n'
+                '2\tcmn\tLatn\tsomeone\tzai4 jian4\n'
+            )
+        )
+
+
+class TestLongestCommonSubstring(unittest.TestCase):
+    def test_repeated_characters(self):
+        self.assertEqual(
+            ((0, 1), 3),  # 'aba'
+            longest_common_substring(['abab', 'baba'])
+        )
+
+    def test_suffix_links(self):
+        # 'bc' occurs twice in both strings, but only once followed by 'd'
+        self.assertEqual(
+            ((5, 0), 3),  # 'bcd'
+            longest_common_substring(['aXbcYbcd', 'bcdZbc'])
+        )
+
+    def test_split_state(self):
+        # 'ba' is first seen as part of 'bba' and later on its own
+        self.assertEqual(
+            ((2, 2), 3),  # 'baa'
+            longest_common_substring(['abbaa', 'babaa'])
+        )
+
+    def test_transitions_of_split_state(self):
+        self.assertEqual(
+            ((1, 0), 2),  # 'bb'
+            longest_common_substring(['abb', 'bba'])
+        )
+
+    def test_position_of_split_state(self):
+        self.assertEqual(
+            ((1, 0), 2),  # 'bb'
+            longest_common_substring(['abbb', 'bbaa'])
+        )
+
+    def test_three_strings(self):
+        self.assertEqual(
+            ((1, 0, 1), 2),  # 'aa'
+            longest_common_substring(['xaaay', 'aaa', 'zaaw'])
+        )
+        # both 'a' and 'b' are shared; 'a' comes first in the shortest string
+        self.assertEqual(
+            ((0, 2, 0), 1),  # 'a'
+            longest_common_substring(['aba', 'bba', 'abb'])
+        )
+
+    def test_order_independent(self):
+        self.assertEqual(
+            ((0, 1), 1),  # 'a'
+            longest_common_substring(['ab', 'ba'])
+        )
+        self.assertEqual(
+            ((1, 0), 1),  # 'a'
+            longest_common_substring(['ba', 'ab'])
+        )
+
+    def test_empty(self):
+        self.assertEqual(
+            ((0, 0), 0),
+            longest_common_substring(['', 'abc'])
+        )
+
+    def test_single(self):
+        self.assertEqual(
+            ((0,), 3),
+            longest_common_substring(['abc'])
+        )
+
+
+class TestCommonBlocks(unittest.TestCase):
+    def test_different(self):
+        self.assertEqual(
+            [((0, 0, 0), 5), ((9, 9, 9), 6)],  # 'Abc {', '} def.'
+            common_blocks('Abc {test} def.', 'Abc {text} def.', 'Abc {fork} def.')
+        )
+
+    def test_repeated_characters(self):
+        self.assertEqual(
+            [((0, 1), 3)],  # 'aba'
+            common_blocks('abab', 'baba')
+        )
+
+    def test_recursion(self):
+        self.assertEqual(
+            [((0, 0), 1), ((2, 1), 1), ((3, 3), 2)],  # 'a', 'b', 'cd'
+            common_blocks('aXbcd', 'abYcd')
+        )
+
+    def test_order_independent(self):
+        self.assertEqual('a', shared_substring('ab', 'ba'))
+        self.assertEqual('a', shared_substring('ba', 'ab'))
+
+    def test_empty(self):
+        self.assertEqual([], common_blocks('', 'abc'))
+        self.assertEqual([], common_blocks('', ''))
+
+    def test_single(self):
+        self.assertEqual([((0,), 3)], common_blocks('abc'))
 
 
 class TestSharedSubstring(unittest.TestCase):
@@ -49,6 +183,18 @@ class TestAlign(unittest.TestCase):
             align(*strings)
         )
 
+    def test_anchored(self):
+        # The prefix and suffix shared by all strings are matched first, even
+        # though 'abcdef' as a whole also occurs in both strings.
+        self.assertEqual(
+            [
+                ('abc', 'abc'),
+                ('Xabc', ''),
+                ('def', 'def'),
+            ],
+            align('abcXabcdef', 'abcdef')
+        )
+
 
 class TestDiffWithContext(unittest.TestCase):
     def test_with_context(self):
@@ -66,6 +212,49 @@ class TestDiffWithContext(unittest.TestCase):
             dwc.with_context(3, 1, left_sep='[', right_sep=']')
         )
 
+    def test_shared_offsets(self):
+        aligned = [
+            ('A', 'B', ''),
+            3 * ('bc {',),
+            ('test', 'text', 'fork'),
+            3 * ('} de',),
+            ('f.', '', 'g'),
+        ]
+        self.assertEqual(
+            (
+                ('Abc {test} def.', 'Bbc {text} de', 'bc {fork} deg'),
+                [(0, 0, 0), (1, 1, 0), (5, 5, 4), (9, 9, 8), (13, 13, 12),
+                 (15, 13, 13)],
+            ),
+            block_offsets(aligned)
+        )
+        shared = block_offsets(aligned)
+        for index in range(len(aligned)):
+            dwc = DiffWithContext(1234, aligned, index, shared)
+            # join the blocks before and after `index` for each string
+            self.assertEqual(
+                [''.join(column) for column in zip(*aligned[:index])]
+                or ['', '', ''],
+                dwc.left_context
+            )
+            self.assertEqual(
+                [''.join(column) for column in zip(*aligned[index+1:])]
+                or ['', '', ''],
+                dwc.right_context
+            )
+        first = DiffWithContext(1234, aligned, 0, shared)
+        self.assertEqual(['', '', ''], first.left_context)
+        self.assertEqual(
+            ['bc {test} def.', 'bc {text} de', 'bc {fork} deg'],
+            first.right_context
+        )
+        last = DiffWithContext(1234, aligned, len(aligned) - 1, shared)
+        self.assertEqual(
+            ['Abc {test} de', 'Bbc {text} de', 'bc {fork} de'],
+            last.left_context
+        )
+        self.assertEqual(['', '', ''], last.right_context)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,4 +1,4 @@
-#!/usr/bin/python
+#!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
 """This is a script for generating mandarin.xml from CC-CEDICT.
@@ -9,23 +9,16 @@ it into the XML format expected by sinoparserd.
 
 from collections import Counter
 import gzip
-try:
-    from urllib.request import urlopen
-except ImportError:  # Python 2
-    from urllib2 import urlopen
+import itertools
+import sys
+from urllib.request import urlopen
 
 from override import override
 from preference import preference
 
 
 def gunzip_urlopen(url):
-    response = urlopen(url)
-    try:
-        import StringIO
-        gzipped_data = response.read()
-        return gzip.GzipFile(fileobj=StringIO.StringIO(gzipped_data))
-    except ImportError:  # Python 3
-        return gzip.open(response, 'rt')
+    return gzip.open(urlopen(url), 'rt', encoding='utf-8')
 
 
 def parse_entry(line):
@@ -35,12 +28,13 @@ def parse_entry(line):
     traditional simplified [pin1 yin1] /meaning 1/meaning 2/
     but we only care about the first three parts.
     """
-    trad, rest = line.split(' ', 1)
-    simp, rest = rest.split(' ', 1)
+    trad, simp, rest = line.split(' ', 2)
     assert rest[0] == '[', "Can't find [pinyin] in line:\n" + line
-    pinyin, rest = rest[1:].split(']', 1)
+    pinyin = rest[1:rest.index(']')]
     pinyin = pinyin.replace('u:', 'v')  # two different representations of ü
-    return (trad, simp, pinyin)
+    # Many entries share the same characters or syllables, so interning lets
+    # them share a single string object.
+    return (sys.intern(trad), sys.intern(simp), sys.intern(pinyin))
 
 
 def join_pinyin(pinyin):
@@ -85,15 +79,23 @@ def remove_prefixes(entries):
         ('最', '最', 'zui4 '),
         ('非常', '非常', 'fei1 chang2 '),
     ]
-    return {
-        entry
-        for entry in entries
-        if not any(
-            all(e.startswith(p) for e, p in zip(entry, prefix))  # has prefix
-            and tuple(e[len(p):] for e, p in zip(entry, prefix)) in entries  # remainder is also an entry
-            for prefix in prefixes
-        )
-    }
+    prefixes = [(prefix, tuple(map(len, prefix))) for prefix in prefixes]
+    prefixed = set()
+    for entry in entries:
+        trad, simp, pinyin = entry
+        for (trad_prefix, simp_prefix, pinyin_prefix), lengths in prefixes:
+            if not (
+                trad.startswith(trad_prefix)
+                and simp.startswith(simp_prefix)
+                and pinyin.startswith(pinyin_prefix)
+            ):
+                continue
+            trad_len, simp_len, pinyin_len = lengths
+            remainder = (trad[trad_len:], simp[simp_len:], pinyin[pinyin_len:])
+            if remainder in entries:  # remainder is also an entry
+                prefixed.add(entry)
+                break
+    return entries - prefixed
 
 
 def sorted_entries(entries, preference):
@@ -110,10 +112,14 @@ def sorted_entries(entries, preference):
         else:
             unambiguous.append(entry)
 
+    preference_index = {}
+    for i, entry in enumerate(preference):
+        preference_index.setdefault(entry, i)  # like preference.index(entry)
+
     def sort_key(entry):
         try:
-            return preference.index(entry)
-        except ValueError:
+            return preference_index[entry]
+        except KeyError:
             raise ValueError(
                 "Missing preference for ambiguous entry:\n {} {} [{}]".format(*entry)
             )
@@ -121,6 +127,7 @@ def sorted_entries(entries, preference):
 
 
 def print_xml():
+    sys.stdout.reconfigure(encoding='utf-8')
     cedict_url = 'https://cc-cedict.org/editor/editor_export_cedict.php?c=gz'
 
     cedict_file = gunzip_urlopen(cedict_url)
@@ -145,17 +152,19 @@ def print_xml():
 
     entries = remove_prefixes(entries)
     entries = sorted_entries(entries, preference)
-    entries = [
+    # The pinyin is joined lazily as the rows are formatted. All rows are
+    # collected and then written in a single call.
+    entries = itertools.chain(override, (
         (trad, simp, join_pinyin(pinyin))
         for (trad, simp, pinyin)
         in entries
-    ]
-    entries = override + entries
-    for i, (trad, simp, pinyin) in enumerate(entries):
+    ))
+    template = '<item id="%d" simp="%s" trad="%s" pinyin="%s" />\n'
+    items = []
+    for i, (trad, simp, pinyin) in enumerate(entries, 1):
         assert '"' not in trad+simp+pinyin
-        print('<item id="{}" simp="{}" trad="{}" pinyin="{}" />'.format(
-            i+1, simp, trad, pinyin
-        ))
+        items.append(template % (i, simp, trad, pinyin))
+    sys.stdout.write(''.join(items))
 
     print('</root>')
 
@@ -1,4 +1,4 @@
-#!/usr/bin/python
+#!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
 import unittest
@@ -118,7 +118,7 @@ class TestSortedEntries(unittest.TestCase):
         )
 
     def test_missing_preference(self):
-        with self.assertRaisesRegexp(ValueError, '呢'):
+        with self.assertRaisesRegex(ValueError, '呢'):
             sorted_entries(
                 self.preference + [
                     ('呢', '呢', 'ne5'),